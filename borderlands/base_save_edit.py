@@ -1,32 +1,52 @@
 #!/usr/bin/env python3
 
+import importlib
 import sys
-import traceback
-from typing import List
+from typing import TYPE_CHECKING, Callable, Dict, List, Tuple
 
-from borderlands.bl2 import AppBL2
-from borderlands.savefile import BaseApp
+if TYPE_CHECKING:
+    from borderlands.savefile import BaseApp
 
-ERROR_TEMPLATE = """
-Something went wrong.
-Arguments: {}
-"""
+
+# Game name -> (module, class name) of its application class.  These are
+# only imported once a game is actually asked for.
+_APPS: Dict[str, Tuple[str, str]] = {
+    'BL2': ('borderlands.bl2', 'AppBL2'),
+}
+
+# Application classes which have already been imported, by game name
+_APP_CLASSES: Dict[str, Callable[[List[str]], 'BaseApp']] = {}
+
+
+def _get_app_class(game_name: str) -> Callable[[List[str]], 'BaseApp']:
+    app_cls = _APP_CLASSES.get(game_name)
+    if app_cls is None:
+        location = _APPS.get(game_name)
+        if location is None:
+            raise RuntimeError(f'unknown game: {game_name!r}')
+
+        module_name, class_name = location
+        app_cls = getattr(importlib.import_module(module_name), class_name)
+        _APP_CLASSES[game_name] = app_cls
+    return app_cls
+
+
+def _format_error(args: List[str]) -> str:
+    return f'\nSomething went wrong.\nArguments: {args!r}\n\n'
 
 
 def run(*, game_name: str, args: List[str]) -> None:
     # noinspection PyBroadException
     try:
-        app: BaseApp
-        if game_name == 'BL2':
-            app = AppBL2(args)
-        else:
-            raise RuntimeError(f'unknown game: {game_name!r}')
-
-        app.run()
+        _get_app_class(game_name)(args).run()
 
     except Exception:
+        import traceback
+
+        # Anything already printed to stdout should still come out before the error
         sys.stdout.flush()
-        sys.stderr.flush()
-        print(ERROR_TEMPLATE.format(repr(args)), file=sys.stderr)
-        traceback.print_exc(None, sys.stderr)
+        stderr = sys.stderr
+        stderr.write(_format_error(args))
+        traceback.print_exc(None, stderr)
+        stderr.flush()
         sys.exit(1)
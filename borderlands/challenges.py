@@ -1,9 +1,13 @@
-import io
 import struct
 from typing import Tuple, Optional, Dict
 
 from borderlands.util.errors import BorderlandsError
 
+# Header and per-challenge layouts, by byte order
+_HEADER = {'<': struct.Struct('<IIH'), '>': struct.Struct('>IIH')}
+_CHALLENGE = {'<': struct.Struct('<HBIBI'), '>': struct.Struct('>HBIBI')}
+_CHALLENGE_FIELDS = ('id', 'first_one', 'total_value', 'second_one', 'previous_value')
+
 
 class ChallengeCategory:
     """
@@ -100,7 +104,7 @@ def unwrap_challenges(*, data: bytes, challenges: Dict[int, Challenge], endian:
 
     """
 
-    unknown, size_in_bytes, num_challenges = struct.unpack(endian + 'IIH', data[:10])
+    unknown, size_in_bytes, num_challenges = _HEADER[endian].unpack_from(data)
     # Sanity check on size reported
     if (size_in_bytes + 8) != len(data):
         raise BorderlandsError(f'Challenge data reported as {size_in_bytes} bytes, but {len(data) - 8} bytes found')
@@ -111,14 +115,8 @@ def unwrap_challenges(*, data: bytes, challenges: Dict[int, Challenge], endian:
 
     # Now read them in
     challenges_result = []
-    for challenge in range(num_challenges):
-        idx = 10 + (challenge * 12)
-        challenge_dict = dict(
-            zip(
-                ['id', 'first_one', 'total_value', 'second_one', 'previous_value'],
-                struct.unpack(endian + 'HBIBI', data[idx: idx + 12]),
-            )
-        )
+    for values in _CHALLENGE[endian].iter_unpack(memoryview(data)[10:]):
+        challenge_dict = dict(zip(_CHALLENGE_FIELDS, values))
         challenges_result.append(challenge_dict)
 
         if challenge_dict['id'] in challenges:
@@ -141,20 +139,12 @@ def wrap_challenges(*, data: dict, endian: str) -> bytes:
     Change the number of challenges at your own risk!
     """
 
-    b = io.BytesIO()
-    b.write(
-        struct.pack(
-            endian + 'IIH',
-            data['unknown'],
-            (len(data['challenges']) * 12) + 2,
-            len(data['challenges']),
-        )
-    )
     save_challenges = data['challenges']
+    pack = _CHALLENGE[endian].pack
+    parts = [_HEADER[endian].pack(data['unknown'], (len(save_challenges) * 12) + 2, len(save_challenges))]
     for challenge in save_challenges:
-        b.write(
-            struct.pack(
-                endian + 'HBIBI',
+        parts.append(
+            pack(
                 challenge['id'],
                 challenge['first_one'],
                 challenge['total_value'],
@@ -162,4 +152,4 @@ def wrap_challenges(*, data: dict, endian: str) -> bytes:
                 challenge['previous_value'],
             )
         )
-    return b.getvalue()
+    return b''.join(parts)
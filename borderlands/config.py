@@ -1,127 +1,234 @@
-import argparse
-import os
-from typing import List
+import functools
+import sys
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, NoReturn, Optional, Tuple, Union
 
+if TYPE_CHECKING:
+    import argparse
 
-class Config(argparse.Namespace):
+# Ordered, since argparse also uses this for the usage and help text
+_OUTPUT_CHOICES = ('savegame', 'decoded', 'decodedjson', 'json', 'items', 'none')
+
+# Output types which don't need an output_filename
+_SAVEGAME_OR_NONE = frozenset(('savegame', 'none'))
+
+
+def _same_file(first: str, second: str) -> bool:
     """
-    Class to hold configuration information
+    Whether two filenames point at the same file.  Paths to the same file
+    that don't even share a basename are rare enough not to look further;
+    otherwise ask the filesystem, which also sees through symlinks, and
+    compare absolute paths if either file doesn't exist yet.
     """
+    import os.path
+
+    if os.path.basename(first) != os.path.basename(second):
+        return False
+    try:
+        return os.path.samefile(first, second)
+    except OSError:
+        return os.path.abspath(first) == os.path.abspath(second)
 
-    # Given by the user, booleans
-    json = False
-    verbose = True
-    force = False
 
-    # Given by the user, strings
-    output = 'savegame'
-    input_filename = '-'
-    output_filename = '-'
+class Config:
+    """
+    Class to hold configuration information.  argparse only needs
+    getattr/setattr on the namespace it fills in, so this uses fixed
+    slots rather than a dict-backed argparse.Namespace.
+    """
+
+    __slots__ = (
+        'json',
+        'verbose',
+        'force',
+        'output',
+        'input_filename',
+        'output_filename',
+    )
 
-    # Config options interpreted from the above
+    # Byte order of the challenge data.  Nothing on the commandline can
+    # change it, so it's a class-level constant rather than a slot.
     endian = '<'
 
+    def __init__(self) -> None:
+        # Given by the user, booleans
+        self.json = False
+        self.verbose = True
+        self.force = False
+
+        # Given by the user, strings
+        self.output = 'savegame'
+        self.input_filename = '-'
+        self.output_filename: Optional[str] = '-'
+
+    def __repr__(self) -> str:
+        fields = ', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)
+        return f'{type(self).__name__}({fields})'
+
+    def __contains__(self, key: str) -> bool:
+        return hasattr(self, key)
+
     def finish(
         self,
         *,
-        parser: argparse.ArgumentParser,
+        parser: Union['argparse.ArgumentParser', '_DeferredParser'],
+        _same_file: Callable[[str, str], bool] = _same_file,
     ) -> None:
         """
         Some extra sanity checks on our options.  "parser" should
         be an active ArgumentParser object we can use to raise
         errors.  "app" is an App object which we use for a couple
-        lookups.
+        lookups.  "_same_file" is bound at definition time purely to
+        skip the global lookup; callers shouldn't pass it.
         """
         # Can't read/write to the same file
-        if (
-            self.output_filename is not None
-            and self.input_filename != '-'
-            and os.path.abspath(self.input_filename) == os.path.abspath(self.output_filename)
-        ):
+        input_filename = self.input_filename
+        output_filename = self.output_filename
+        if output_filename is None or input_filename == '-':
+            return
+
+        if input_filename == output_filename or _same_file(input_filename, output_filename):
             parser.error('input_filename and output_filename cannot be the same file')
 
 
-class DictAction(argparse.Action):
+# Help text, already collapsed to the single-spaced form the help
+# formatter would otherwise have to produce from triple-quoted blocks
+_DESCRIPTION = 'Start Parsing'
+_HELP_OUTPUT = (
+    'Output file format. The most useful to humans are: savegame, json, and items. '
+    'If no output file is specified, this will revert to `none`.'
+)
+_HELP_JSON = 'read savegame data from JSON format, rather than savegame'
+_HELP_FORCE = 'force output file overwrite, if the destination file exists'
+_HELP_INPUT_FILENAME = 'Input filename, can be "-" to specify STDIN'
+_HELP_OUTPUT_FILENAME = (
+    'Output filename, can be "-" to specify STDOUT. Can be optional, in which case no output file is produced.'
+)
+
+
+# (flags, add_argument keyword arguments) for every commandline argument
+_ARG_SPECS: Tuple[Tuple[Tuple[str, ...], Dict[str, Any]], ...] = (
+    # Optional args.  dest is spelled out so argparse keys its actions and
+    # namespace on interned literals rather than strings derived from the flag.
+    (
+        ('-o', '--output'),
+        dict(dest='output', choices=_OUTPUT_CHOICES, default='savegame', type=sys.intern, help=_HELP_OUTPUT),
+    ),
+    (('-j', '--json'), dict(dest='json', action='store_true', help=_HELP_JSON)),
+    (('-f', '--force'), dict(dest='force', action='store_true', help=_HELP_FORCE)),
+    # Positional args
+    (('input_filename',), dict(help=_HELP_INPUT_FILENAME)),
+    (('output_filename',), dict(nargs='?', help=_HELP_OUTPUT_FILENAME)),
+)
+
+
+# Optional args _fast_parse can handle itself, by flag: their dest and
+# add_argument keyword arguments.  Anything using other add_argument
+# features is left out, so it always goes through argparse.
+_FAST_KWARGS = frozenset(('dest', 'action', 'choices', 'default', 'type', 'help'))
+_FAST_FLAGS: Dict[str, Dict[str, Any]] = {
+    flag: kwargs
+    for flags, kwargs in _ARG_SPECS
+    if flags[0].startswith('-')
+    and 'dest' in kwargs
+    and kwargs.get('action', 'store') in ('store', 'store_true')
+    and _FAST_KWARGS.issuperset(kwargs)
+    for flag in flags
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _build_parser() -> 'argparse.ArgumentParser':
     """
-    Custom argparse action to put list-like arguments into
-    a dict (where the value will be True) rather than a list.
-    This is probably implemented fairly shoddily.
+    Build the ArgumentParser used by parse_args.  The parser holds no
+    per-run state, so it's built once and reused by every later call.
     """
+    import argparse
 
-    def __init__(self, option_strings, dest, nargs=None, **kwargs):
-        """
-        Constructor, taken right from https://docs.python.org/2.7/library/argparse.html#action
-        """
-        if nargs is not None:
-            raise ValueError('nargs is not allowed')
-        super().__init__(option_strings, dest, **kwargs)
+    parser = argparse.ArgumentParser(
+        description=_DESCRIPTION,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
 
-    def __call__(self, parser, namespace, values, option_string=None):
-        """
-        Actually setting a value.  Forces the attr into a dict if it isn't already.
-        """
-        arg_value = getattr(namespace, self.dest)
-        if not isinstance(arg_value, dict):
-            arg_value = {}
-        arg_value[values] = True
-        setattr(namespace, self.dest, arg_value)
+    for flags, kwargs in _ARG_SPECS:
+        parser.add_argument(*flags, **kwargs)
 
+    return parser
 
-def parse_args(
-    *,
-    args: List[str],
-):
+
+class _DeferredParser:
     """
-    Parse our arguments.
+    Stands in for the ArgumentParser when _fast_parse handled the
+    commandline, so the real parser only gets built if there's an
+    error to report.
     """
-    # Set up our config object
-    config = Config()
 
-    parser = argparse.ArgumentParser(
-        description=f'Start Parsing',
-        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
-    )
+    @staticmethod
+    def error(message: str) -> NoReturn:
+        _build_parser().error(message)
 
-    # Optional args
-    parser.add_argument(
-        '-o',
-        '--output',
-        choices=['savegame', 'decoded', 'decodedjson', 'json', 'items', 'none'],
-        default='savegame',
-        help="""
-                Output file format.  The most useful to humans are: savegame, json, and items.
-                If no output file is specified, this will revert to `none`.
-                """,
-    )
 
-    parser.add_argument(
-        '-j',
-        '--json',
-        action='store_true',
-        help='read savegame data from JSON format, rather than savegame',
-    )
-
-    parser.add_argument(
-        '-f',
-        '--force',
-        action='store_true',
-        help='force output file overwrite, if the destination file exists',
-    )
-
-    # Positional args
-    parser.add_argument('input_filename', help='Input filename, can be "-" to specify STDIN')
+def _fast_parse(args: List[str]) -> Optional[Config]:
+    """
+    Parse the common, well-formed commandlines without argparse.  Anything
+    else (help, abbreviations, `--output=json`, bad values, wrong number of
+    filenames...) returns None so the full parser can handle it and give
+    its usual messages.
+    """
+    config = Config()
+    positionals: List[str] = []
+    # argparse only assigns the filenames from a single run of them
+    positionals_closed = False
+    args_iter = iter(args)
+    for arg in args_iter:
+        if arg == '-' or not arg.startswith('-'):
+            if positionals_closed:
+                return None
+            positionals.append(arg)
+            continue
+        if positionals:
+            positionals_closed = True
+        kwargs = _FAST_FLAGS.get(arg)
+        if kwargs is None:
+            return None
+        if kwargs.get('action') == 'store_true':
+            setattr(config, kwargs['dest'], True)
+            continue
+        value = next(args_iter, None)
+        if value is None or value.startswith('-'):
+            return None
+        choices = kwargs.get('choices')
+        if choices is not None and value not in choices:
+            return None
+        convert = kwargs.get('type')
+        setattr(config, kwargs['dest'], value if convert is None else convert(value))
+
+    if len(positionals) == 1:
+        config.input_filename = positionals[0]
+        config.output_filename = None
+    elif len(positionals) == 2:
+        config.input_filename, config.output_filename = positionals
+    else:
+        return None
+    return config
 
-    parser.add_argument(
-        'output_filename',
-        nargs='?',
-        help="""
-                Output filename, can be "-" to specify STDOUT.  Can be optional, in
-                which case no output file is produced.
-                """,
-    )
 
-    # Actually parse the args
-    parser.parse_args(args, config)
+def parse_args(
+    *,
+    args: List[str],
+):
+    """
+    Parse our arguments.
+    """
+    # Actually parse the args, only falling back to argparse when needed
+    parser: Union['argparse.ArgumentParser', _DeferredParser]
+    config = _fast_parse(args)
+    if config is None:
+        config = Config()
+        parser = _build_parser()
+        parser.parse_args(args, config)
+    else:
+        parser = _DeferredParser()
+    error = parser.error
 
     # Do some extra fiddling
     config.finish(parser=parser)
@@ -134,8 +241,8 @@ def parse_args(
         # It's possible in this case that the user explicitly set `savegame` as the
         # output, rather than just leaving it at the default, but I don't think it's
         # worth the shenanigans necessary to detect that.
-        if config.output not in {'savegame', 'none'}:
-            parser.error(f"No output_filename was specified, but output type '{config.output}' was specified")
+        if config.output not in _SAVEGAME_OR_NONE:
+            error(f"No output_filename was specified, but output type '{config.output}' was specified")
 
         # If we got here, we're probably good, but force ourselves to `none` output
         config.output = 'none'
@@ -143,6 +250,6 @@ def parse_args(
     else:
         # If we have an output filename but `none` output, complain about it.
         if config.output == 'none':
-            parser.error("Output filename specified but with `none` output")
+            error("Output filename specified but with `none` output")
 
     return config
@@ -1,18 +1,19 @@
-import base64
 import binascii
 import dataclasses
+import functools
 import hashlib
-import io
+import itertools
 import json
 import os
 import struct
 import sys
-from typing import List, Tuple, Dict, Any, Optional, IO, Union
+import zlib
+from typing import List, Tuple, Dict, Any, Optional, IO
 
 from borderlands.challenges import Challenge, unwrap_challenges, wrap_challenges
 from borderlands.config import parse_args
 from borderlands.util.bitstreams import ReadBitstream, WriteBitstream
-from borderlands.util.common import conv_binary_to_str, rotate_data_right, xor_data, create_body
+from borderlands.util.common import _ITEM_HEADER, conv_binary_to_str, rotate_data_right, xor_data, create_body
 from borderlands.util.common import invert_structure
 from borderlands.util.data_types import PlayerDict
 from borderlands.util.errors import BorderlandsError
@@ -26,15 +27,33 @@ from borderlands.util.huffman import (
 )
 from borderlands.util.lzo1x import lzo1x_decompress, lzo1x_1_compress
 from borderlands.util.protobuf import (
-    read_protobuf_value,
     read_repeated_protobuf_value,
     write_repeated_protobuf_value,
     read_protobuf,
+    find_canonical_field,
     apply_structure,
     write_protobuf,
     remove_structure,
 )
 
+# Precompiled struct formats for the item and savefile headers
+_SAVE_HEADER = struct.Struct('>I3sI')
+_SAVE_CRC_SIZE = {'>': struct.Struct('>II'), '<': struct.Struct('<II')}
+_SAVE_WRAP_HEADER = struct.Struct('>I3s')
+_SAVE_WRAP_VERSION_CRC_SIZE = {'>': struct.Struct('>III'), '<': struct.Struct('<III')}
+
+if sys.version_info >= (3, 9):
+
+    def _sha1(data) -> bytes:
+        # The savefile digest is only an integrity check, so let hashlib
+        # know it isn't security related
+        return hashlib.sha1(data, usedforsecurity=False).digest()
+
+else:
+
+    def _sha1(data) -> bytes:
+        return hashlib.sha1(data).digest()
+
 
 @dataclasses.dataclass(frozen=True)
 class InputFileData:
@@ -58,6 +77,32 @@ class BaseApp:
         (("type", 6), ("balance", 10), ("manufacturer", 7)),
     )
 
+    # Lookup tables derived from item_sizes and item_header_sizes by
+    # _derive_item_tables, separately for every subclass, so a game which
+    # overrides the sizes gets tables to match:
+    #  - item_masks: bit masks matching each of the item_sizes
+    #  - item_fields: (start bit, mask) of each field, and item_bits: the
+    #    total bit count, for items which are long enough to hold every field
+    #  - item_header_masks: bit masks for the asset half of each header field
+    item_masks: Tuple[Tuple[int, ...], ...]
+    item_fields: Tuple[Tuple[Tuple[int, int], ...], ...]
+    item_bits: Tuple[int, ...]
+    item_header_masks: Tuple[Tuple[int, ...], ...]
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        cls._derive_item_tables()
+
+    @classmethod
+    def _derive_item_tables(cls) -> None:
+        cls.item_masks = tuple(tuple((1 << size) - 1 for size in sizes) for sizes in cls.item_sizes)
+        cls.item_fields = tuple(
+            tuple(zip(itertools.accumulate(sizes[:-1], initial=0), masks))
+            for sizes, masks in zip(cls.item_sizes, cls.item_masks)
+        )
+        cls.item_bits = tuple(sum(sizes) for sizes in cls.item_sizes)
+        cls.item_header_masks = tuple(tuple((1 << bits) - 1 for _, bits in sizes) for sizes in cls.item_header_sizes)
+
     def __init__(
             self,
             *,
@@ -98,47 +143,48 @@ class BaseApp:
         self.save_structure = self.create_save_structure()
 
     def pack_item_values(self, is_weapon: int, values: list) -> bytes:
+        # Build the whole item as one little-endian integer, then convert
+        # it to bytes in one go, rather than OR-ing it in a byte at a time
         i = 0
-        item_bytes = bytearray(32)
+        packed = 0
         for value, size in zip(values, self.item_sizes[is_weapon]):
             if value is None:
                 break
-            j = i >> 3
-            value = value << (i & 7)
-            while value != 0:
-                item_bytes[j] |= value & 0xFF
-                value = value >> 8
-                j = j + 1
+            packed |= value << i
             i = i + size
         if (i & 7) != 0:
-            value = 0xFF << (i & 7)
-            item_bytes[i >> 3] |= value & 0xFF
-        return bytes(item_bytes[: (i + 7) >> 3])
+            # Pad out the rest of the last byte with set bits
+            packed |= (0xFF >> (i & 7)) << i
+        length = (i + 7) >> 3
+        return (packed & ((1 << (length << 3)) - 1)).to_bytes(length, 'little')
 
     def unpack_item_values(self, is_weapon: int, data: bytes) -> List[Optional[int]]:
-        i = 8
-        data = b' ' + data
+        # Mirror of pack_item_values: read the item as one integer and
+        # shift each field out of it
+        packed = int.from_bytes(data, 'little')
         end = len(data) * 8
+        if end >= self.item_bits[is_weapon]:
+            # Every field fits, so their positions are all known up front
+            return [(packed >> start) & mask for start, mask in self.item_fields[is_weapon]]
+
+        i = 0
         result: List[Optional[int]] = []
-        for size in self.item_sizes[is_weapon]:
+        for size, mask in zip(self.item_sizes[is_weapon], self.item_masks[is_weapon]):
             j = i + size
             if j > end:
                 result.append(None)
                 continue
-            value = 0
-            for b in data[j >> 3: (i >> 3) - 1: -1]:
-                value = (value << 8) | b
-            result.append((value >> (i & 7)) & ~(0xFF << size))
+            result.append((packed >> i) & mask)
             i = j
         return result
 
     def wrap_item(self, *, is_weapon: int, values: list, key: int) -> bytes:
         item = self.pack_item_values(is_weapon, values)
-        header = struct.pack(">Bi", (is_weapon << 7) | self.item_struct_version, key)
+        header = _ITEM_HEADER.pack((is_weapon << 7) | self.item_struct_version, key)
         return header + create_body(item=item, header=header, key=key)
 
     def unwrap_item(self, data: bytes) -> Tuple[int, List[Optional[int]], int]:
-        version_type, key = struct.unpack(">Bi", data[:5])
+        version_type, key = _ITEM_HEADER.unpack_from(data)
         is_weapon = version_type >> 7
         raw = rotate_data_right(xor_data(data[5:], key >> 5), key & 31)
         return is_weapon, self.unpack_item_values(is_weapon, raw[2:]), key
@@ -165,24 +211,21 @@ class BaseApp:
             'key': key,
             'set': item[0],
             'level': (item[4], item[5]),  # (grade_index, game_stage)
-            '_base64': base64.b64encode(value),
+            '_base64': binascii.b2a_base64(value, newline=False),
         }
-        for i, (k, bits) in enumerate(self.item_header_sizes[is_weapon]):
-            x = item[1 + i]
+        header_fields = zip(self.item_header_sizes[is_weapon], self.item_header_masks[is_weapon], item[1:4])
+        for (k, bits), mask, x in header_fields:
             if x is None:
                 sys.exit('unwrap_item_info got None instead of int')
-            lib = x >> bits
-            asset = x & ~(lib << bits)
-            data[k] = {"lib": lib, "asset": asset}
+            data[k] = {"lib": x >> bits, "asset": x & mask}
         bits = 10 + is_weapon
+        mask = (1 << bits) - 1
         parts: List[Optional[Dict[str, Any]]] = []
         for x in item[6:]:
             if x is None:
                 parts.append(None)
             else:
-                lib = x >> bits
-                asset = x & ~(lib << bits)
-                parts.append({"lib": lib, "asset": asset})
+                parts.append({"lib": x >> bits, "asset": x & mask})
         data["parts"] = parts
         return data
 
@@ -209,24 +252,24 @@ class BaseApp:
         I suspect this might actually be wrong, though, and just happens to
         work.
         """
-        if data[:20] != hashlib.sha1(data[20:]).digest():
+        # Hash and decompress straight out of the original buffer, rather
+        # than copying everything after the digest first
+        body = memoryview(data)[20:]
+        if data[:20] != _sha1(body):
             raise BorderlandsError("Invalid save file")
 
-        data = lzo1x_decompress(b'\xf0' + data[20:])
-        size, wsg, version = struct.unpack('>I3sI', data[:11])
+        data = lzo1x_decompress(b'\xf0' + body)
+        size, wsg, version = _SAVE_HEADER.unpack_from(data)
         if version != 2 and version != 0x02000000:
             raise BorderlandsError(f'Unknown save version {version}')
 
-        if version == 2:
-            crc, size = struct.unpack(">II", data[11:19])
-        else:
-            crc, size = struct.unpack("<II", data[11:19])
+        crc, size = _SAVE_CRC_SIZE['>' if version == 2 else '<'].unpack_from(data, 11)
 
         bitstream = ReadBitstream(data[19:])
         tree = read_huffman_tree(bitstream)
         player = huffman_decompress(tree, bitstream, size)
 
-        if (binascii.crc32(player) & 0xFFFFFFFF) != crc:
+        if zlib.crc32(player) != crc:
             raise BorderlandsError("CRC check failed")
 
         return player
@@ -237,27 +280,27 @@ class BaseApp:
         unwrap_player_data above, so we're leaving that hardcoded for now.
         I suspect that it's wrong to be doing so, though.
         """
-        crc = binascii.crc32(player) & 0xFFFFFFFF
+        crc = zlib.crc32(player)
 
         bitstream = WriteBitstream()
         tree = make_huffman_tree(player)
         write_huffman_tree(tree, bitstream)
         huffman_compress(invert_tree(tree), player, bitstream)
-        data = bitstream.getvalue() + b"\x00\x00\x00\x00"
+        body = bitstream.getvalue()
 
-        header = struct.pack(">I3s", len(data) + 15, b'WSG')
-        header += struct.pack(self.config.endian + "III", 2, crc, len(player))
+        # Assemble header, body and trailing padding in a single buffer,
+        # rather than concatenating (and copying) the body twice
+        data = bytearray(_SAVE_WRAP_HEADER.pack(len(body) + 19, b'WSG'))
+        data += _SAVE_WRAP_VERSION_CRC_SIZE[self.config.endian].pack(2, crc, len(player))
+        data += body
+        data += b"\x00\x00\x00\x00"
 
-        data = lzo1x_1_compress(header + data)[1:]
+        compressed = memoryview(lzo1x_1_compress(data))[1:]
 
-        return hashlib.sha1(data).digest() + data
+        return _sha1(compressed) + compressed
 
     def _get_rich(self, player: PlayerDict) -> None:
-        raw = player[6][0][1]
-        b = io.BytesIO(raw)
-        values = []
-        while b.tell() < len(raw):
-            values.append(read_protobuf_value(b, 0))
+        values = read_repeated_protobuf_value(player[6][0][1], 0)
 
         self.debug(f' - Setting Money to 99 999 999')
         values[0] = 99999999
@@ -269,14 +312,47 @@ class BaseApp:
         values[4] = 999
         player[6][0] = [0, values]
 
-    def modify_save(self, data: bytes) -> bytes:
-        player = read_protobuf(self.unwrap_player_data(data))
+    def modify_player_data(self, player_data: bytes) -> bytes:
+        """
+        Applies our changes to already unwrapped player data.
+        """
+        # _get_rich only changes the currency field, so when nothing else
+        # would be normalised by re-encoding, decode and re-encode just that
+        span = find_canonical_field(player_data, 6)
+        if span is not None:
+            start, end = span
+            currency = read_protobuf(player_data[start:end])
+            self._get_rich(currency)
+            return player_data[:start] + write_protobuf(currency) + player_data[end:]
+
+        player = read_protobuf(player_data)
         self._get_rich(player)
-        return self.wrap_player_data(write_protobuf(player))
+        return write_protobuf(player)
+
+    def modify_save(self, data: bytes) -> bytes:
+        """
+        Applies our changes to a savegame, returning the new savegame.
+        """
+        player_data = self.unwrap_player_data(data)
+        player = self.modify_player_data(player_data)
+        if player == player_data:
+            # Nothing changed (the save was already maxed out), so the
+            # original is as good as a freshly wrapped copy
+            return data
+        return self.wrap_player_data(player)
 
     def create_save_structure(self) -> Dict[int, Any]:
         raise NotImplementedError()
 
+    @functools.cached_property
+    def inverted_save_structure(self) -> Dict[str, Any]:
+        """
+        save_structure keyed by name rather than field number, for turning
+        'json' output back into protobuf data.  Only JSON input needs it,
+        so it's built on first use and kept from then on.
+        """
+        return invert_structure(self.save_structure)
+
     @staticmethod
     def notice(message) -> None:
         print(message)
@@ -289,16 +365,18 @@ class BaseApp:
         if self.config.verbose:
             self.notice(message)
 
-    def _read_input_file(self) -> Union[str, bytes]:
+    def _read_input_file(self) -> bytes:
         if self.config.input_filename == '-':
             self.debug('Using STDIN for input file')
-            return sys.stdin.read()
+            # Savegames are binary, so skip the text layer; json.loads
+            # takes the bytes as-is for JSON input
+            return sys.stdin.buffer.read()
         else:
             self.debug(f'Opening {self.config.input_filename} for input file')
             with open(self.config.input_filename, 'rb') as inp:
                 return inp.read()
 
-    def _convert_json(self, save_data: Union[str, bytes]) -> Union[str, bytes]:
+    def _convert_json(self, save_data: bytes) -> bytes:
         if not self.config.json:
             return save_data
 
@@ -306,7 +384,7 @@ class BaseApp:
         data = json.loads(save_data)
         if '1' not in data:
             # This means the file had been output as 'json'
-            data = remove_structure(data, invert_structure(self.save_structure))
+            data = remove_structure(data, self.inverted_save_structure)
         return self.wrap_player_data(write_protobuf(data))
 
     def _prepare_output_file(self) -> Optional[Tuple[IO, bool]]:
@@ -362,10 +440,19 @@ class BaseApp:
         # If we're reading from JSON, convert it
         save_data = self._convert_json(save_data)
 
-        new_data = self.modify_save(save_data)
+        # Only savegame output (and the changes check) needs the result
+        # wrapped back up, the other outputs work on the player data as-is
+        new_data = None
+        player = None
+        if self.config.output in ('savegame', 'none'):
+            new_data = self.modify_save(save_data)
+        else:
+            player = self.modify_player_data(self.unwrap_player_data(save_data))
 
         # If we have an output file, write to it
         if self.config.output_filename is None:
+            if new_data is None:
+                raise BorderlandsError(f"Output type '{self.config.output}' needs an output filename")
             if new_data != save_data:
                 sys.exit('Changes were made but no output file specified')
 
@@ -379,20 +466,23 @@ class BaseApp:
         output_file, close = output_file_info
 
         # Now output based on what we've been told to do
-        if self.config.output == 'savegame':
+        if new_data is not None:
             self.debug('Writing savegame file')
             output_file.write(new_data)
-        else:
-            player = self.unwrap_player_data(new_data)
+        elif player is not None:
             if self.config.output in ('decodedjson', 'json'):
                 self.debug('Converting to JSON for more human-readable output')
                 data = read_protobuf(player)
                 if self.config.output == 'json':
                     data = apply_structure(data, self.save_structure)
-                player = json.dumps(conv_binary_to_str(data), sort_keys=True, indent=4)
-            output_file.write(player)
+                output_file.write(json.dumps(conv_binary_to_str(data), sort_keys=True, indent=4))
+            else:
+                output_file.write(player)
 
         if close:
             output_file.close()
 
         self.notice('Done')
+
+
+BaseApp._derive_item_tables()
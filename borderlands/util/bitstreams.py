@@ -1,6 +1,3 @@
-import copy
-
-
 class ReadBitstream:
     def __init__(self, s: bytes) -> None:
         self.s = s
@@ -14,17 +11,14 @@ class ReadBitstream:
         return bit & 1
 
     def read_bits(self, n: int) -> int:
-        s = self.s
         i = self.i
         end = i + n
-        chunk = s[i >> 3 : (end + 7) >> 3]
-        value = chunk[0] & ~(0xFF00 >> (i & 7))
-        for c in chunk[1:]:
-            value = (value << 8) | c
+        # Load every byte the bits touch in one go, then trim both ends
+        value = int.from_bytes(self.s[i >> 3 : (end + 7) >> 3], 'big')
         if (end & 7) != 0:
             value = value >> (8 - (end & 7))
         self.i = end
-        return value
+        return value & ((1 << n) - 1)
 
     def read_byte(self) -> int:
         i = self.i
@@ -37,53 +31,39 @@ class ReadBitstream:
 
 
 class WriteBitstream:
+    """
+    Bits are collected in an integer register, most significant first,
+    and only moved into the output eight bytes at a time, rather than
+    being shuffled into the output a byte (or bit) at a time.
+    """
+
     def __init__(self) -> None:
         self.s = bytearray()
-        self.byte = 0
-        self.i = 7
+        self.register = 0
+        # Number of bits currently held in the register, always < 64
+        self.register_bits = 0
 
     def write_bit(self, b: int) -> None:
-        i = self.i
-        byte = self.byte | (b << i)
-        if i == 0:
-            self.s.append(byte)
-            self.byte = 0
-            self.i = 7
-        else:
-            self.byte = byte
-            self.i = i - 1
+        self.write_bits(b, 1)
 
     def write_bits(self, b: int, n: int) -> None:
-        s = self.s
-        byte = self.byte
-        i = self.i
-        while n >= (i + 1):
-            shift = n - (i + 1)
-            n = n - (i + 1)
-            byte = byte | (b >> shift)
-            b = b & ~(byte << shift)
-            s.append(byte)
-            byte = 0
-            i = 7
-        if n > 0:
-            byte = byte | (b << (i + 1 - n))
-            i = i - n
-        self.s = s
-        self.byte = byte
-        self.i = i
+        register = (self.register << n) | b
+        register_bits = self.register_bits + n
+        if register_bits >= 64:
+            register_bits -= 64
+            self.s += (register >> register_bits).to_bytes(8, 'big')
+            register &= (1 << register_bits) - 1
+        self.register = register
+        self.register_bits = register_bits
 
     def write_byte(self, b: int) -> None:
-        i = self.i
-        if i == 7:
-            self.s.append(b)
-        else:
-            self.s.append(self.byte | (b >> (7 - i)))
-            self.byte = (b << (i + 1)) & 0xFF
+        self.write_bits(b, 8)
 
     def getvalue(self) -> bytes:
-        if self.i != 7:
-            ret_s = copy.copy(self.s)
-            ret_s.append(self.byte)
-            return bytes(ret_s)
-        else:
+        register_bits = self.register_bits
+        if register_bits == 0:
             return bytes(self.s)
+        # Pad the final partial byte out with zero bits
+        length = (register_bits + 7) >> 3
+        tail = self.register << ((length << 3) - register_bits)
+        return bytes(self.s) + tail.to_bytes(length, 'big')
@@ -1,14 +1,20 @@
-import binascii
 import struct
+import zlib
 from typing import Any, Union, List, Dict
 
+_FLOAT = struct.Struct("<f")
+_UINT32 = struct.Struct("<I")
+_CHECKSUM = struct.Struct(">H")
+_ITEM_KEY = struct.Struct(">i")
+_ITEM_HEADER = struct.Struct(">Bi")
+
 
 def wrap_float(v: float) -> List[Union[int, Any]]:
-    return [5, struct.unpack("<I", struct.pack("<f", v))[0]]
+    return [5, _UINT32.unpack(_FLOAT.pack(v))[0]]
 
 
 def unwrap_float(v: Any) -> float:
-    return struct.unpack("<f", struct.pack("<I", v))[0]
+    return _FLOAT.unpack(_UINT32.pack(v))[0]
 
 
 def unwrap_bytes(value: bytes) -> list:
@@ -45,14 +51,15 @@ def conv_binary_to_str(data: Any) -> Any:
     doesn't like that some of the data is binary (since that's invalid in
     JSON).  Python 2 would just cast those as strings automatically.
     So this will loop through and convert everything that's binary
-    into a string.
+    into a string.  Ints make up about half the leaves of a decoded
+    save, so they're passed through without recursing.
     """
     if isinstance(data, bytes):
         return data.decode('latin1')
     elif isinstance(data, dict):
-        return {k: conv_binary_to_str(v) for k, v in data.items()}
+        return {k: v if type(v) is int else conv_binary_to_str(v) for k, v in data.items()}
     elif isinstance(data, list):
-        return [conv_binary_to_str(x) for x in data]
+        return [x if type(x) is int else conv_binary_to_str(x) for x in data]
     else:
         return data
 
@@ -68,24 +75,30 @@ def rotate_data_left(data: bytes, steps: int) -> bytes:
 
 
 def xor_data(data, key: int) -> bytes:
+    # The key stream has to be stepped one byte at a time, but the XOR
+    # itself is done across the whole buffer at once as a single integer
     key = key & 0xFFFFFFFF
-    output = bytearray()
-    for c in data:
+    if key % 4294967291 == 0:
+        # The key stream would be all zeroes, leaving the data as it is
+        return bytes(data)
+    length = len(data)
+    key_stream = bytearray(length)
+    for i in range(length):
         key = (key * 279470273) % 4294967291
-        output.append((c ^ key) & 0xFF)
-    return bytes(output)
+        key_stream[i] = key & 0xFF
+    return (int.from_bytes(data, 'little') ^ int.from_bytes(key_stream, 'little')).to_bytes(length, 'little')
 
 
 def create_body(*, item: bytes, header: bytes, key: int) -> bytes:
     padding = b"\xff" * (33 - len(item))
-    h = binascii.crc32(header + b"\xff\xff" + item + padding) & 0xFFFFFFFF
-    checksum = struct.pack(">H", ((h >> 16) ^ h) & 0xFFFF)
+    h = zlib.crc32(header + b"\xff\xff" + item + padding)
+    checksum = _CHECKSUM.pack(((h >> 16) ^ h) & 0xFFFF)
     body = xor_data(rotate_data_left(checksum + item, key & 31), key >> 5)
     return body
 
 
 def replace_raw_item_key(data: bytes, key: int) -> bytes:
-    old_key = struct.unpack(">i", data[1:5])[0]
+    old_key = _ITEM_KEY.unpack_from(data, 1)[0]
     item = rotate_data_right(xor_data(data[5:], old_key >> 5), old_key & 31)[2:]
-    header = struct.pack(">Bi", data[0], key)
+    header = _ITEM_HEADER.pack(data[0], key)
     return header + create_body(item=item, header=header, key=key)
@@ -1,7 +1,12 @@
 from bisect import insort
+from typing import Final, List, Optional, Tuple
 
 from borderlands.util.bitstreams import ReadBitstream, WriteBitstream
 
+# How many bits huffman_decompress looks up at once.  Needs to stay <= 17
+# so that any (unaligned) lookup fits in a three-byte window.
+DECODE_TABLE_BITS: Final = 11
+
 
 class HuffmanNode:
     """
@@ -91,16 +96,70 @@ def invert_tree(node, code=0, bits=0) -> dict:
         return result
 
 
+def make_decode_table(tree, bits: int = DECODE_TABLE_BITS) -> Tuple[List[int], List[int], List[Optional[tuple]]]:
+    """
+    Flattens the top of a huffman tree into lookup tables indexed by the
+    next `bits` bits of the stream.  For codes no longer than `bits`,
+    `symbols` and `lengths` give the decoded byte and how many bits it
+    actually used; for longer codes `lengths` is 0 and `nodes` holds the
+    subtree reached after the first `bits` bits, to be walked bit by bit.
+    """
+    table_size = 1 << bits
+    symbols = [0] * table_size
+    lengths = [0] * table_size
+    nodes: List[Optional[tuple]] = [None] * table_size
+
+    def fill(node, code: int, depth: int) -> None:
+        if isinstance(node[1], int):
+            shift = bits - depth
+            start = code << shift
+            for entry in range(start, start + (1 << shift)):
+                symbols[entry] = node[1]
+                lengths[entry] = depth
+        elif depth == bits:
+            nodes[code] = node
+        else:
+            fill(node[1][0], code << 1, depth + 1)
+            fill(node[1][1], (code << 1) | 1, depth + 1)
+
+    fill(tree, 0, 0)
+    return symbols, lengths, nodes
+
+
 def huffman_decompress(tree, bitstream, size) -> bytes:
+    if isinstance(tree[1], int):
+        # Only one distinct byte, which huffman_compress encodes in zero bits
+        return bytes([tree[1]]) * size
+
+    bits = DECODE_TABLE_BITS
+    symbols, lengths, nodes = make_decode_table(tree, bits)
+    table_mask = (1 << bits) - 1
+    window_shift = 24 - bits
+
+    # Padded so that a lookup near the end can always read three bytes
+    s = bytes(bitstream.s) + b'\x00\x00\x00'
+    i = bitstream.i
     output = bytearray()
-    while len(output) < size:
-        node = tree
+    append = output.append
+    for _ in range(size):
+        p = i >> 3
+        peek = (((s[p] << 16) | (s[p + 1] << 8) | s[p + 2]) >> (window_shift - (i & 7))) & table_mask
+        length = lengths[peek]
+        if length:
+            append(symbols[peek])
+            i += length
+            continue
+
+        # Code is longer than the table, finish it off one bit at a time
+        node = nodes[peek]
+        i += bits
         while True:
-            b = bitstream.read_bit()
-            node = node[1][b]
+            node = node[1][(s[i >> 3] >> (7 - (i & 7))) & 1]
+            i += 1
             if isinstance(node[1], int):
-                output.append(node[1])
+                append(node[1])
                 break
+    bitstream.i = i
     return bytes(output)
 
 
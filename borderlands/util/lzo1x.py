@@ -1,5 +1,5 @@
 import sys
-from typing import Final, Optional, Tuple
+from typing import Final, Optional, Tuple, Union
 
 CLZ_TABLE: Final = (
     32,
@@ -42,7 +42,7 @@ CLZ_TABLE: Final = (
 )
 
 
-def expand_zeroes(*, src: bytearray, ip: int, extra: int) -> Tuple[int, int]:
+def expand_zeroes(*, src: bytes, ip: int, extra: int) -> Tuple[int, int]:
     start = ip
     # TODO: add check for src.size
     while src[ip] == 0:
@@ -51,8 +51,12 @@ def expand_zeroes(*, src: bytearray, ip: int, extra: int) -> Tuple[int, int]:
     return v + extra, ip + 1
 
 
-def copy_earlier(*, b: bytearray, offset: int, chunk_size: int) -> None:
+def copy_earlier(b: bytearray, offset: int, chunk_size: int) -> None:
     i = len(b) - offset
+    if offset >= chunk_size:
+        # Source and destination don't overlap, so it's a single slice
+        b += b[i: i + chunk_size]
+        return
     end = i + chunk_size
     while i < end:
         chunk = b[i: i + chunk_size]
@@ -61,7 +65,7 @@ def copy_earlier(*, b: bytearray, offset: int, chunk_size: int) -> None:
         b.extend(chunk)
 
 
-def read_xor32(src: bytearray, p1: int, p2: int) -> int:
+def read_xor32(src: Union[bytes, bytearray], p1: int, p2: int) -> int:
     v1 = src[p1] | (src[p1 + 1] << 8) | (src[p1 + 2] << 16) | (src[p1 + 3] << 24)
     v2 = src[p2] | (src[p2 + 1] << 8) | (src[p2 + 2] << 16) | (src[p2 + 3] << 24)
     return v1 ^ v2
@@ -69,7 +73,8 @@ def read_xor32(src: bytearray, p1: int, p2: int) -> int:
 
 def lzo1x_decompress(s: bytes) -> bytes:
     dst = bytearray()
-    src = bytearray(s)
+    # Only ever indexed and sliced, so there's no need for a mutable copy
+    src = s
     ip = 5
 
     t = src[ip]
@@ -91,14 +96,14 @@ def lzo1x_decompress(s: bytes) -> bytes:
     while True:
         while True:
             if t >= 64:
-                copy_earlier(b=dst, offset=1 + ((t >> 2) & 7) + (src[ip] << 3), chunk_size=(t >> 5) + 1)
+                copy_earlier(dst, 1 + ((t >> 2) & 7) + (src[ip] << 3), (t >> 5) + 1)
                 ip += 1
             elif t >= 32:
                 count = t & 31
                 if count == 0:
                     count, ip = expand_zeroes(src=src, ip=ip, extra=31)
                 t = src[ip]
-                copy_earlier(b=dst, offset=1 + ((t | (src[ip + 1] << 8)) >> 2), chunk_size=count + 2)
+                copy_earlier(dst, 1 + ((t | (src[ip + 1] << 8)) >> 2), count + 2)
                 ip += 2
             elif t >= 16:
                 offset = (t & 8) << 11
@@ -110,9 +115,9 @@ def lzo1x_decompress(s: bytes) -> bytes:
                 ip += 2
                 if offset == 0:
                     return bytes(dst)
-                copy_earlier(b=dst, offset=offset + 0x4000, chunk_size=count + 2)
+                copy_earlier(dst, offset + 0x4000, count + 2)
             else:
-                copy_earlier(b=dst, offset=1 + (t >> 2) + (src[ip] << 2), chunk_size=2)
+                copy_earlier(dst, 1 + (t >> 2) + (src[ip] << 2), 2)
                 ip += 1
 
             t = t & 3
@@ -134,7 +139,7 @@ def lzo1x_decompress(s: bytes) -> bytes:
                 t = src[ip]
                 ip += 1
             if t < 16:
-                copy_earlier(b=dst, offset=1 + 0x0800 + (t >> 2) + (src[ip] << 2), chunk_size=3)
+                copy_earlier(dst, 1 + 0x0800 + (t >> 2) + (src[ip] << 2), 3)
                 ip += 1
                 t = t & 3
                 if t == 0:
@@ -146,7 +151,9 @@ def lzo1x_decompress(s: bytes) -> bytes:
             break
 
 
-def lzo1x_1_compress_core(*, src: bytearray, dst: bytearray, ti: int, ip_start: int, ip_len: int) -> Optional[int]:
+def lzo1x_1_compress_core(
+    *, src: Union[bytes, bytearray], dst: bytearray, ti: int, ip_start: int, ip_len: int
+) -> Optional[int]:
     dict_entries = [0] * 16384
 
     in_end = ip_start + ip_len
@@ -239,8 +246,8 @@ def lzo1x_1_compress_core(*, src: bytearray, dst: bytearray, ti: int, ip_start:
             dst.append((m_off >> 6) & 0xFF)
 
 
-def lzo1x_1_compress(s: bytes) -> bytes:
-    src = bytearray(s)
+def lzo1x_1_compress(s: Union[bytes, bytearray]) -> bytes:
+    src = s
     dst = bytearray()
 
     ip = 0
@@ -1,11 +1,14 @@
 import io
 import struct
-from typing import Any
+from typing import Any, Optional, Tuple
 
 from borderlands.util.common import wrap_bytes, guess_wire_type
 from borderlands.util.data_types import PlayerDict
 from borderlands.util.errors import BorderlandsError
 
+_FIXED64 = struct.Struct("<Q")
+_FIXED32 = struct.Struct("<I")
+
 
 def remove_structure(data: dict, inv: dict) -> dict:
     result = {}
@@ -71,6 +74,31 @@ def read_varint(f: io.BytesIO) -> int:
     return value
 
 
+def read_varint_at(data: bytes, pos: int) -> Tuple[int, int]:
+    """
+    Reads a varint straight out of `data` at `pos`, returning the value and
+    the position just past it.  One and two byte varints (by far the most
+    common) are handled without going through the general loop.
+    """
+    b = data[pos]
+    if b < 0x80:
+        return b, pos + 1
+    value = b & 0x7F
+    b = data[pos + 1]
+    if b < 0x80:
+        return value | (b << 7), pos + 2
+    value |= (b & 0x7F) << 7
+    offset = 14
+    pos = pos + 2
+    while True:
+        b = data[pos]
+        pos = pos + 1
+        value |= (b & 0x7F) << offset
+        if b < 0x80:
+            return value, pos
+        offset = offset + 7
+
+
 def write_varint(f: io.BytesIO, i: int) -> None:
     while i > 0x7F:
         f.write(bytes([0x80 | (i & 0x7F)]))
@@ -92,11 +120,32 @@ def read_protobuf_value(b: io.BytesIO, wire_type: int) -> Any:
         raise BorderlandsError("Unsupported wire type " + str(wire_type))
 
 
+def read_protobuf_value_at(data: bytes, pos: int, wire_type: int) -> Tuple[Any, int]:
+    """
+    Same as read_protobuf_value, but reading straight out of `data` at
+    `pos` rather than from a stream.  Returns the value and the position
+    just past it.
+    """
+    if wire_type == 0:
+        return read_varint_at(data, pos)
+    elif wire_type == 1:
+        return _FIXED64.unpack_from(data, pos)[0], pos + 8
+    elif wire_type == 2:
+        length, pos = read_varint_at(data, pos)
+        return data[pos : pos + length], pos + length
+    elif wire_type == 5:
+        return _FIXED32.unpack_from(data, pos)[0], pos + 4
+    else:
+        raise BorderlandsError("Unsupported wire type " + str(wire_type))
+
+
 def read_repeated_protobuf_value(data: bytes, wire_type: int) -> list:
-    b = io.BytesIO(data)
     values = []
-    while b.tell() < len(data):
-        values.append(read_protobuf_value(b, wire_type))
+    pos = 0
+    end_position = len(data)
+    while pos < end_position:
+        value, pos = read_protobuf_value_at(data, pos, wire_type)
+        values.append(value)
     return values
 
 
@@ -127,17 +176,63 @@ def write_repeated_protobuf_value(data: list, wire_type: int) -> bytes:
 
 def read_protobuf(data: bytes) -> PlayerDict:
     fields: PlayerDict = {}
+    pos = 0
     end_position = len(data)
-    bytestream = io.BytesIO(data)
-    while bytestream.tell() < end_position:
-        key = read_varint(bytestream)
+    while pos < end_position:
+        key, pos = read_varint_at(data, pos)
         field_number = key >> 3
         wire_type = key & 7
-        value = read_protobuf_value(bytestream, wire_type)
+        value, pos = read_protobuf_value_at(data, pos, wire_type)
         fields.setdefault(field_number, []).append([wire_type, value])
     return fields
 
 
+def find_canonical_field(data: bytes, field_number: int) -> Optional[Tuple[int, int]]:
+    """
+    Finds the (start, end) byte range holding every entry for field_number
+    in `data`, so that one field can be re-encoded and spliced back in
+    without round-tripping the whole message.  That's only equivalent when
+    write_protobuf(read_protobuf(data)) would give back `data` unchanged,
+    i.e. the fields are in ascending order and every varint is minimally
+    encoded, so this returns None if they aren't, or the field is missing.
+    """
+    start = end = None
+    last_number = -1
+    pos = 0
+    end_position = len(data)
+    while pos < end_position:
+        entry_start = pos
+        key, pos = read_varint_at(data, pos)
+        # A varint whose last byte is zero has a shorter encoding
+        if data[pos - 1] == 0 and pos - entry_start > 1:
+            return None
+        field_number_here = key >> 3
+        if field_number_here < last_number:
+            return None
+        last_number = field_number_here
+        wire_type = key & 7
+        if wire_type == 0 or wire_type == 2:
+            value_start = pos
+            value, pos = read_varint_at(data, pos)
+            if data[pos - 1] == 0 and pos - value_start > 1:
+                return None
+            if wire_type == 2:
+                pos = pos + value
+        elif wire_type == 1:
+            pos = pos + 8
+        elif wire_type == 5:
+            pos = pos + 4
+        else:
+            raise BorderlandsError("Unsupported wire type " + str(wire_type))
+        if field_number_here == field_number:
+            if start is None:
+                start = entry_start
+            end = pos
+    if pos > end_position or start is None or end is None:
+        return None
+    return start, end
+
+
 def apply_structure(pb_data: PlayerDict, s: dict) -> dict:
     fields = {}
     raw = {}